@@ -9,180 +9,223 @@ Features:
 - Aligns audio with transcription for accurate timestamps
 - Outputs a formatted Markdown file with timestamped speaker segments
 - Supports early stopping with Ctrl+C
+- Loads the models in the background while recording
 """
 
 import whisperx
+import torch
 import datetime
 import sounddevice as sd
-from scipy.io.wavfile import write
+import wave
 import os
 import sys
 import time
+import numpy as np
 from whisperx.diarize import DiarizationPipeline
-from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
-HF_TOKEN = os.getenv('HF_TOKEN')
-
-if not HF_TOKEN:
-    raise ValueError("[ERROR] HF_TOKEN not found in .env file. Please add your Hugging Face token.")
-
 # === Configuration ===
 DURATION_MINUTES = 60
 SAMPLERATE = 16000
 CHANNELS = 1
+PROGRESS_INTERVAL = 10  # Seconds between recording countdown updates
 MODEL_SIZE = "medium"
-DEVICE = "cpu"
-
-print("[DEBUG] Script started.")
-print(f"[DEBUG] Current working directory: {os.getcwd()}")
-print(f"[DEBUG] Using Whisper model: {MODEL_SIZE} on device: {DEVICE}")
-print(f"[DEBUG] Audio recording duration: {DURATION_MINUTES} minutes")
-
-# === Prepare filename ===
-now = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-filename = f"meeting_{now}.wav"
-print(f"[DEBUG] Output audio filename: {filename}")
-
-# === Record Audio with interactive countdown ===
-try:
-    duration = DURATION_MINUTES * 60
-    print(f"[INFO] Recording for {DURATION_MINUTES} minutes... Press Ctrl+C to stop early.")
-    start_time = time.time()
-    audio = sd.rec(int(duration * SAMPLERATE), samplerate=SAMPLERATE, channels=CHANNELS)
-    while True:
-        elapsed = int(time.time() - start_time)
-        remaining = int(duration - elapsed)
-        if remaining <= 0:
-            break
-        print(f"\r[RECORDING] {elapsed}s elapsed, {remaining}s remaining", end="")
-        time.sleep(1)
-    sd.wait()
-    print("\n[INFO] Recording complete.")
-except KeyboardInterrupt:
-    print("\n[WARNING] Recording manually interrupted! Saving partial audio...")
-    sd.stop()
-except Exception as e:
-    print(f"[ERROR] Recording failed: {e}")
-    sys.exit(1)
-
-# === Save WAV file ===
-try:
-    write(filename, SAMPLERATE, audio)
-    print(f"[INFO] Audio saved to {filename}")
-except Exception as e:
-    print(f"[ERROR] Failed to write WAV file: {e}")
-    sys.exit(1)
-
-# === Load WhisperX model and transcribe (float32 for CPU) ===
-try:
-    print("[INFO] Loading WhisperX model...")
-    model = whisperx.load_model(MODEL_SIZE, device=DEVICE, compute_type="float32")
-    print("[INFO] Transcribing audio...")
-    result = model.transcribe(filename)
-    print("[DEBUG] Transcription result (first 3 segments):")
-    for seg in result['segments'][:3]:
-        print(f"  -> {seg['start']:.2f}s - {seg['end']:.2f}s: {seg['text']}")
-except Exception as e:
-    print(f"[ERROR] Transcription failed: {e}")
-    sys.exit(1)
-
-# === Alignment ===
-try:
-    print("[INFO] Performing alignment...")
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+COMPUTE_TYPE = "float16" if DEVICE == "cuda" else "float32"
+SEGMENTATION_BATCH_SIZE = 32  # Sliding windows per diarization segmentation forward pass
+EMBEDDING_BATCH_SIZE = 64     # Speaker embeddings per diarization forward pass
+BATCH_SIZE = 16               # Audio chunks per Whisper forward pass
+# Greedy decoding: one hypothesis per chunk instead of WhisperX's default beam of 5
+ASR_OPTIONS = {"beam_size": 1, "best_of": 1, "condition_on_previous_text": False}
+
+def load_models():
+    """Load the WhisperX transcription and alignment models"""
+    # A preset language loads the English tokenizer once instead of detecting it per call
+    model = whisperx.load_model(MODEL_SIZE, device=DEVICE, compute_type=COMPUTE_TYPE,
+                                language="en", asr_options=ASR_OPTIONS)
     align_model, metadata = whisperx.load_align_model(language_code="en", device=DEVICE)
-    result = whisperx.align(result["segments"], align_model, metadata, filename, DEVICE)
-    print("[DEBUG] Alignment successful. Sample word segment:")
-    print(result["word_segments"][0])
-except Exception as e:
-    print(f"[ERROR] Alignment failed: {e}")
-    sys.exit(1)
-
-# === Diarization ===
-try:
-    print("[INFO] Running diarization...")
-    diarization_pipeline = DiarizationPipeline(use_auth_token=HF_TOKEN, device=DEVICE)
-    diarization_segments = diarization_pipeline(filename)
-    print(f"[DEBUG] Diarization complete. Found {len(diarization_segments)} speaker segments.")
-except Exception as e:
-    print(f"[ERROR] Diarization failed: {e}")
-    sys.exit(1)
-
-# === Assign speakers ===
-try:
-    print("[INFO] Assigning speaker labels...")
-    if not result.get("word_segments"):
-        raise ValueError("No word_segments found in aligned transcription")
-
-    # Debug the word segments structure
-    print("[DEBUG] Sample word segment structure:", result["word_segments"][0] if result["word_segments"] else "None")
-
-    # Assign speakers and store the result
-    result = whisperx.assign_word_speakers(diarization_segments, result)
-
-    if not isinstance(result["word_segments"], list):
-        raise TypeError("Expected word_segments to be a list")
-
-    # Group words by speaker
-    grouped = defaultdict(list)
-    for word in result["word_segments"]:
-        if isinstance(word, dict):
-            speaker = word.get("speaker", "SPEAKER_UNKNOWN")
+    return model, align_model, metadata
+
+def main():
+    # Load environment variables
+    load_dotenv()
+    HF_TOKEN = os.getenv('HF_TOKEN')
+
+    if not HF_TOKEN:
+        raise ValueError("[ERROR] HF_TOKEN not found in .env file. Please add your Hugging Face token.")
+
+    print("[DEBUG] Script started.")
+    print(f"[DEBUG] Current working directory: {os.getcwd()}")
+    print(f"[DEBUG] Using Whisper model: {MODEL_SIZE} on device: {DEVICE} ({COMPUTE_TYPE})")
+    print(f"[DEBUG] Audio recording duration: {DURATION_MINUTES} minutes")
+
+    # === Prepare filename ===
+    now = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"meeting_{now}.wav"
+    print(f"[DEBUG] Output audio filename: {filename}")
+
+    # === Load models in the background while recording ===
+    print("[INFO] Loading WhisperX models in the background...")
+    model_loader = ThreadPoolExecutor(max_workers=1)
+    models_future = model_loader.submit(load_models)
+    model_loader.shutdown(wait=False)
+
+    # === Record Audio with countdown ===
+    # Samples are streamed to disk as 16-bit PCM from the input callback, so the
+    # recording never has to sit in memory as one large buffer
+    try:
+        duration = DURATION_MINUTES * 60
+        print(f"[INFO] Recording for {DURATION_MINUTES} minutes... Press Ctrl+C to stop early.")
+        with open(filename, "wb", buffering=1 << 20) as fh, wave.open(fh, "wb") as wav:
+            wav.setnchannels(CHANNELS)
+            wav.setsampwidth(2)
+            wav.setframerate(SAMPLERATE)
+
+            def write_block(indata, frames, time_info, status):
+                if status:
+                    print(f"\n[WARNING] Recording status: {status}")
+                # writeframesraw skips the per-call header patch; the header is fixed on close
+                wav.writeframesraw(indata)
+
+            try:
+                with sd.InputStream(samplerate=SAMPLERATE, channels=CHANNELS, dtype="int16",
+                                    blocksize=4096, callback=write_block):
+                    # Refresh the countdown every PROGRESS_INTERVAL seconds instead of every second
+                    for elapsed in range(0, duration, PROGRESS_INTERVAL):
+                        sys.stdout.write(f"\r[RECORDING] {elapsed}s elapsed, {duration - elapsed}s remaining")
+                        sys.stdout.flush()
+                        time.sleep(min(PROGRESS_INTERVAL, duration - elapsed))
+                print("\n[INFO] Recording complete.")
+            except KeyboardInterrupt:
+                print("\n[WARNING] Recording manually interrupted! Saving partial audio...")
+        print(f"[INFO] Audio saved to {filename}")
+    except Exception as e:
+        print(f"[ERROR] Recording failed: {e}")
+        sys.exit(1)
+
+    # === Transcribe with the preloaded WhisperX model (float16 on GPU, float32 on CPU) ===
+    try:
+        print("[INFO] Waiting for WhisperX models...")
+        model, align_model, metadata = models_future.result()
+        print("[INFO] Transcribing audio...")
+        # One call over the whole recording: WhisperX cuts it at VAD silences itself,
+        # so no word is split at an arbitrary slice boundary.
+        # Setting the language skips the detection pass over the first 30s
+        result = model.transcribe(filename, batch_size=BATCH_SIZE, language="en")
+        print("[DEBUG] Transcription result (first 3 segments):")
+        for seg in result['segments'][:3]:
+            print(f"  -> {seg['start']:.2f}s - {seg['end']:.2f}s: {seg['text']}")
+    except Exception as e:
+        print(f"[ERROR] Transcription failed: {e}")
+        sys.exit(1)
+
+    # === Alignment ===
+    try:
+        print("[INFO] Performing alignment...")
+        result = whisperx.align(result["segments"], align_model, metadata, filename, DEVICE)
+        print("[DEBUG] Alignment successful. Sample word segment:")
+        print(result["word_segments"][0])
+    except Exception as e:
+        print(f"[ERROR] Alignment failed: {e}")
+        sys.exit(1)
+
+    # === Diarization ===
+    try:
+        print("[INFO] Running diarization...")
+        diarization_pipeline = DiarizationPipeline(use_auth_token=HF_TOKEN, device=torch.device(DEVICE))
+        # Batch the segmentation and embedding inference of the underlying pyannote pipeline
+        diarization_pipeline.model.segmentation_batch_size = SEGMENTATION_BATCH_SIZE
+        diarization_pipeline.model.embedding_batch_size = EMBEDDING_BATCH_SIZE
+        diarization_segments = diarization_pipeline(filename)
+        print(f"[DEBUG] Diarization complete. Found {len(diarization_segments)} speaker segments.")
+    except Exception as e:
+        print(f"[ERROR] Diarization failed: {e}")
+        sys.exit(1)
+
+    # === Assign speakers ===
+    try:
+        print("[INFO] Assigning speaker labels...")
+        if not result.get("word_segments"):
+            raise ValueError("No word_segments found in aligned transcription")
+
+        # Debug the word segments structure
+        print("[DEBUG] Sample word segment structure:", result["word_segments"][0] if result["word_segments"] else "None")
+
+        # Assign speakers and store the result
+        result = whisperx.assign_word_speakers(diarization_segments, result)
+
+        if not isinstance(result["word_segments"], list):
+            raise TypeError("Expected word_segments to be a list")
+        # The list is homogeneous, so check the element type once instead of per word
+        if not isinstance(result["word_segments"][0], dict):
+            raise TypeError("Expected word_segments to contain dicts")
+
+        # Group words by speaker into parallel arrays, one row per word
+        word_segments = result["word_segments"]
+        starts = np.empty(len(word_segments))
+        ends = np.empty(len(word_segments))
+        spk_ids = np.empty(len(word_segments), dtype=np.int32)
+        texts = [None] * len(word_segments)
+        speaker_ids = {}
+        get = dict.get
+        n_words = 0
+        for word in word_segments:
             # Use 'word' key instead of 'text' if that's how it's structured
-            word_text = word.get("word", "") or word.get("text", "")
-            if word_text:  # Only append if we have text
-                grouped[speaker].append({
-                    "start": word.get("start", 0),
-                    "end": word.get("end", 0),
-                    "text": word_text
-                })
-
-    # Create final segments from grouped words
-    final_segments = []
-    for speaker, words in grouped.items():
-        if words:  # Check if there are any words for this speaker
-            start = words[0]["start"]
-            end = words[-1]["end"]
-            text = " ".join(w["text"] for w in words)
+            word_text = get(word, "word") or get(word, "text")
+            if not word_text:  # Only keep words that have text
+                continue
+            speaker = get(word, "speaker", "SPEAKER_UNKNOWN")
+            spk_ids[n_words] = speaker_ids.setdefault(speaker, len(speaker_ids))
+            starts[n_words] = get(word, "start", 0)
+            ends[n_words] = get(word, "end", 0)
+            texts[n_words] = word_text
+            n_words += 1
+        spk_ids = spk_ids[:n_words]
+
+        # Create final segments from grouped words, joining each speaker's text once
+        final_segments = []
+        for speaker, speaker_id in speaker_ids.items():
+            idx = np.flatnonzero(spk_ids == speaker_id)
             final_segments.append({
                 "speaker": speaker,
-                "start": start,
-                "end": end,
-                "text": text
+                "start": float(starts[idx[0]]),
+                "end": float(ends[idx[-1]]),
+                "text": " ".join([texts[i] for i in idx.tolist()])
             })
 
-    if final_segments:
-        print("[DEBUG] First speaker-labeled segment:")
-        print(final_segments[0])
-    else:
-        print("[DEBUG] Word segments structure:", result["word_segments"])
-        raise ValueError("No speaker segments were created")
-
-except Exception as e:
-    print(f"[ERROR] Speaker assignment failed: {e}")
-    print(f"[DEBUG] Result type: {type(result)}")
-    print(f"[DEBUG] Word segments sample:", 
-          result["word_segments"][0] if result.get("word_segments") else "None")
-    sys.exit(1)
-
-# === Save Markdown output ===
-try:
-    output_md = filename.replace(".wav", ".md")
-    print(f"[INFO] Writing Markdown transcript to {output_md}...")
-    with open(output_md, "w", encoding="utf-8") as f:
-        f.write(f"# Transcript – {now}\n\n")
-        for segment in final_segments:
-            speaker = segment.get("speaker", "Speaker ?")
-            start = segment["start"]
-            end = segment["end"]
-            text = segment["text"].strip()
-            f.write(f"### {speaker} ({start:.2f}s – {end:.2f}s)\n\n{text}\n\n")
-    print("[SUCCESS] Markdown transcript saved.")
-except Exception as e:
-    print(f"[ERROR] Failed to save markdown file: {e}")
-    sys.exit(1)
-
-print("[DONE] All steps completed successfully.")
-
+        if final_segments:
+            print("[DEBUG] First speaker-labeled segment:")
+            print(final_segments[0])
+        else:
+            print("[DEBUG] Word segments structure:", result["word_segments"])
+            raise ValueError("No speaker segments were created")
+
+    except Exception as e:
+        print(f"[ERROR] Speaker assignment failed: {e}")
+        print(f"[DEBUG] Result type: {type(result)}")
+        print(f"[DEBUG] Word segments sample:", 
+              result["word_segments"][0] if result.get("word_segments") else "None")
+        sys.exit(1)
+
+    # === Save Markdown output ===
+    try:
+        output_md = filename.replace(".wav", ".md")
+        print(f"[INFO] Writing Markdown transcript to {output_md}...")
+        with open(output_md, "w", encoding="utf-8") as f:
+            f.write(f"# Transcript – {now}\n\n")
+            for segment in final_segments:
+                speaker = segment.get("speaker", "Speaker ?")
+                start = segment["start"]
+                end = segment["end"]
+                text = segment["text"].strip()
+                f.write(f"### {speaker} ({start:.2f}s – {end:.2f}s)\n\n{text}\n\n")
+        print("[SUCCESS] Markdown transcript saved.")
+    except Exception as e:
+        print(f"[ERROR] Failed to save markdown file: {e}")
+        sys.exit(1)
+
+    print("[DONE] All steps completed successfully.")
+
+if __name__ == "__main__":
+    main()
@@ -5,8 +5,8 @@ A script that transcribes WAV audio files using WhisperX and performs speaker di
 with enhanced confidence scoring and segment merging.
 
 ## Features
-- Transcribes audio using WhisperX's medium model
-- Performs speaker diarization and alignment
+- Transcribes audio using faster-whisper's medium model (int8 on CPU)
+- Performs speaker diarization and alignment in parallel
 - Merges close segments from the same speaker
 - Calculates speaker confidence scores
 - Outputs a formatted Markdown file with:
@@ -17,6 +17,7 @@ with enhanced confidence scoring and segment merging.
 ## Usage
 ```powershell
 python go_transcribe.py path/to/audio.wav
+python go_transcribe.py --batch first.wav second.wav
 ```
 
 ## Output
@@ -27,16 +28,24 @@ Creates a Markdown file next to the input file containing:
 """
 
 import whisperx
+import torch
 import datetime
+import hashlib
 import sounddevice as sd
-from scipy.io.wavfile import write
 import os
 import sys
 import time
 from whisperx.diarize import DiarizationPipeline
 from collections import defaultdict
+from functools import lru_cache
+from operator import itemgetter
 from dotenv import load_dotenv
 import argparse
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from faster_whisper import WhisperModel
+from pyannote.audio import __version__ as PYANNOTE_VERSION
+from pyannote.core import SlidingWindow, SlidingWindowFeature
 
 # Load environment variables
 load_dotenv()
@@ -47,7 +56,8 @@ if not HF_TOKEN:
 
 # === Configuration ===
 MODEL_SIZE = "medium"
-DEVICE = "cpu"
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+COMPUTE_TYPE = "float16" if DEVICE == "cuda" else "int8"
 
 # Diarization configuration
 DIARIZATION_CONFIG = {
@@ -55,31 +65,45 @@ DIARIZATION_CONFIG = {
     'max_speakers': 5,
     'min_duration': 0.2,     # Minimum duration for speech segments
     'threshold': 0.4,        # Threshold for voice activity detection
-    'uri_key': None          # For consistent speaker labeling across files
+    'uri_key': None,         # For consistent speaker labeling across files
+    'segmentation_batch_size': 32,  # Sliding windows per segmentation forward pass
+    'embedding_batch_size': 64,     # Speaker embeddings per forward pass
+    'cache_segmentation': False     # Development aid: reuse segmentation scores when re-diarizing the same audio
 }
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+SEGMENTATION_CACHE_DIR = os.path.join(CACHE_DIR, "segmentation")
 
 def merge_close_segments(segments, max_gap=1.0):
     """Merge segments from the same speaker that are close together"""
+    if not segments:
+        return []
+
+    # Pull every field in one C-level pass, then sort all columns by start together
+    starts, ends, speakers, texts = zip(*map(itemgetter('start', 'end', 'speaker', 'text'), segments))
+    order = np.argsort(starts, kind='stable')
+    starts = np.asarray(starts, dtype=float)[order]
+    ends = np.asarray(ends, dtype=float)[order]
+    order = order.tolist()
+    speakers = [speakers[i] for i in order]
+    texts = [texts[i] for i in order]
+
+    # Find group boundaries for all segments in a single vectorized pass
+    speaker_arr = np.array(speakers)
+    # A new group starts wherever the gap is too large or the speaker changes
+    boundary = (starts[1:] - ends[:-1] > max_gap) | (speaker_arr[1:] != speaker_arr[:-1])
+    firsts = np.flatnonzero(np.concatenate(([True], boundary)))
+    lasts = np.append(firsts[1:], len(segments)) - 1
+
     merged = []
-    current = None
-    
-    for segment in sorted(segments, key=lambda x: x['start']):
-        if not current:
-            current = segment.copy()
-            continue
-            
-        if (segment['start'] - current['end'] <= max_gap and 
-            segment['speaker'] == current['speaker']):
-            # Merge segments
-            current['end'] = segment['end']
-            current['text'] += ' ' + segment['text']
-        else:
-            merged.append(current)
-            current = segment.copy()
-    
-    if current:
-        merged.append(current)
-    
+    for first, last, start, end in zip(firsts.tolist(), lasts.tolist(),
+                                       starts[firsts].tolist(), ends[lasts].tolist()):
+        merged.append({
+            'speaker': speakers[first],
+            'start': start,
+            'end': end,
+            'text': ' '.join(texts[first:last + 1])
+        })
+
     return merged
 
 def calculate_speaker_confidence(segments):
@@ -101,39 +125,67 @@ def calculate_speaker_confidence(segments):
     
     return speaker_stats
 
-def main():
-    # Set up command line argument parsing
-    parser = argparse.ArgumentParser(
-        description='Transcribe WAV file with speaker diarization'
-    )
-    parser.add_argument(
-        'input_file',
-        help='Path to the WAV file to transcribe'
-    )
-    args = parser.parse_args()
-
-    # Validate input file
-    if not os.path.exists(args.input_file):
-        print(f"[ERROR] File not found: {args.input_file}")
-        sys.exit(1)
-    if not args.input_file.endswith('.wav'):
-        print(f"[ERROR] File must be a WAV file: {args.input_file}")
-        sys.exit(1)
-
-    print("[DEBUG] Script started.")
-    print(f"[DEBUG] Current working directory: {os.getcwd()}")
-    print(f"[DEBUG] Input file: {args.input_file}")
-    print(f"[DEBUG] Using Whisper model: {MODEL_SIZE} on device: {DEVICE}")
-
-    # Replace the filename variable with args.input_file
-    filename = args.input_file
-
-    # === Load WhisperX model and transcribe (float32 for CPU) ===
+def cache_segmentations(diarization_pipeline, cache_dir=SEGMENTATION_CACHE_DIR):
+    """Store pyannote segmentation scores on disk, keyed by the model and a hash of the audio samples"""
+    pipeline = diarization_pipeline.model
+    compute_segmentations = pipeline.get_segmentations
+    # Scores from another segmentation model or pyannote release must not be reused
+    model_id = f"{getattr(pipeline, 'segmentation_model', type(pipeline).__name__)}@{PYANNOTE_VERSION}"
+
+    def get_segmentations(file, hook=None):
+        if "waveform" not in file:
+            return compute_segmentations(file, hook=hook)
+
+        # Hash the samples in place rather than copying them out with tobytes()
+        digest = hashlib.sha256(model_id.encode())
+        digest.update(np.ascontiguousarray(file["waveform"].numpy()))
+        cache_key = digest.hexdigest()
+        cache_path = os.path.join(cache_dir, f"{cache_key}.segmentation.npz")
+        if os.path.exists(cache_path):
+            print(f"[DEBUG] Using cached segmentation: {cache_path}")
+            with np.load(cache_path) as cached:
+                window = SlidingWindow(start=float(cached['start']),
+                                       duration=float(cached['duration']),
+                                       step=float(cached['step']))
+                return SlidingWindowFeature(cached['data'], window)
+
+        segmentations = compute_segmentations(file, hook=hook)
+        os.makedirs(cache_dir, exist_ok=True)
+        window = segmentations.sliding_window
+        np.savez(cache_path, data=segmentations.data,
+                 start=window.start, duration=window.duration, step=window.step)
+        return segmentations
+
+    pipeline.get_segmentations = get_segmentations
+
+@lru_cache(maxsize=None)
+def load_align_model(language_code, device):
+    """Load the WhisperX alignment model once per language and device"""
+    return whisperx.load_align_model(language_code=language_code, device=device)
+
+def transcribe_file(filename, model, diarization_pipeline):
+    """Transcribe, diarize and write the Markdown transcript for one WAV file"""
+    print(f"[DEBUG] Input file: {filename}")
+
+    # === Transcribe with faster-whisper (float16 on GPU, int8 on CPU) ===
     try:
-        print("[INFO] Loading WhisperX model...")
-        model = whisperx.load_model(MODEL_SIZE, device=DEVICE, compute_type="float32")
         print("[INFO] Transcribing audio...")
-        result = model.transcribe(filename)
+        # Setting the language skips the detection pass over the first 30s
+        # Greedy decoding and VAD keep the decoder off silent audio and limit it to one hypothesis
+        segments, info = model.transcribe(
+            filename,
+            language="en",
+            beam_size=1,
+            best_of=1,
+            condition_on_previous_text=False,
+            vad_filter=True,
+            vad_parameters=dict(min_silence_duration_ms=500)
+        )
+        # Wrap the lazy segment generator in the dict shape WhisperX expects for alignment
+        result = {
+            "segments": [{"start": s.start, "end": s.end, "text": s.text} for s in segments],
+            "language": info.language
+        }
         print("[DEBUG] Transcription result (first 3 segments):")
         for seg in result['segments'][:3]:
             print(f"  -> {seg['start']:.2f}s - {seg['end']:.2f}s: {seg['text']}")
@@ -141,38 +193,50 @@ def main():
         print(f"[ERROR] Transcription failed: {e}")
         sys.exit(1)
 
-    # === Alignment ===
-    try:
-        print("[INFO] Performing alignment...")
-        align_model, metadata = whisperx.load_align_model(language_code="en", device=DEVICE)
-        result = whisperx.align(result["segments"], align_model, metadata, filename, DEVICE)
-        print("[DEBUG] Alignment successful. Sample word segment:")
-        print(result["word_segments"][0])
-    except Exception as e:
-        print(f"[ERROR] Alignment failed: {e}")
-        sys.exit(1)
-
-    # === Diarization ===
-    try:
-        print("[INFO] Running diarization...")
-        # Initialize pipeline without speaker parameters
-        diarization_pipeline = DiarizationPipeline(use_auth_token=HF_TOKEN, device=DEVICE)
-
-        # Run diarization with speaker parameters
-        diarization_segments = diarization_pipeline(
-            filename,
-            num_speakers=DIARIZATION_CONFIG['max_speakers'],  # Use max_speakers as num_speakers
-            min_speakers=DIARIZATION_CONFIG['min_speakers'],
-            max_speakers=DIARIZATION_CONFIG['max_speakers']
-        )
-        
-        print(f"[DEBUG] Diarization complete. Found {len(diarization_segments)} speaker segments.")
-        print(f"[DEBUG] First diarization segment: {next(iter(diarization_segments))}")
-
-    except Exception as e:
-        print(f"[ERROR] Diarization failed: {e}")
-        print("[DEBUG] Full error:", str(e))
-        sys.exit(1)
+    # Alignment and diarization are independent until speaker assignment, so run
+    # them concurrently (torch releases the GIL during inference)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        # === Alignment ===
+        try:
+            print("[INFO] Performing alignment...")
+            align_model, metadata = load_align_model(result["language"], DEVICE)
+            align_future = executor.submit(whisperx.align, result["segments"], align_model, metadata, filename, DEVICE)
+        except Exception as e:
+            print(f"[ERROR] Alignment failed: {e}")
+            sys.exit(1)
+
+        # === Diarization ===
+        try:
+            print("[INFO] Running diarization...")
+            # Run diarization with speaker parameters
+            diarization_future = executor.submit(
+                diarization_pipeline,
+                filename,
+                num_speakers=DIARIZATION_CONFIG['max_speakers'],  # Use max_speakers as num_speakers
+                min_speakers=DIARIZATION_CONFIG['min_speakers'],
+                max_speakers=DIARIZATION_CONFIG['max_speakers']
+            )
+        except Exception as e:
+            print(f"[ERROR] Diarization failed: {e}")
+            print("[DEBUG] Full error:", str(e))
+            sys.exit(1)
+
+        try:
+            result = align_future.result()
+            print("[DEBUG] Alignment successful. Sample word segment:")
+            print(result["word_segments"][0])
+        except Exception as e:
+            print(f"[ERROR] Alignment failed: {e}")
+            sys.exit(1)
+
+        try:
+            diarization_segments = diarization_future.result()
+            print(f"[DEBUG] Diarization complete. Found {len(diarization_segments)} speaker segments.")
+            print(f"[DEBUG] First diarization segment: {next(iter(diarization_segments))}")
+        except Exception as e:
+            print(f"[ERROR] Diarization failed: {e}")
+            print("[DEBUG] Full error:", str(e))
+            sys.exit(1)
 
     # === Assign speakers ===
     try:
@@ -188,34 +252,42 @@ def main():
 
         if not isinstance(result["word_segments"], list):
             raise TypeError("Expected word_segments to be a list")
-
-        # Group words by speaker
-        grouped = defaultdict(list)
-        for word in result["word_segments"]:
-            if isinstance(word, dict):
-                speaker = word.get("speaker", "SPEAKER_UNKNOWN")
-                # Use 'word' key instead of 'text' if that's how it's structured
-                word_text = word.get("word", "") or word.get("text", "")
-                if word_text:  # Only append if we have text
-                    grouped[speaker].append({
-                        "start": word.get("start", 0),
-                        "end": word.get("end", 0),
-                        "text": word_text
-                    })
-
-        # Create final segments from grouped words
+        # The list is homogeneous, so check the element type once instead of per word
+        if not isinstance(result["word_segments"][0], dict):
+            raise TypeError("Expected word_segments to contain dicts")
+
+        # Group words by speaker into parallel arrays, one row per word
+        word_segments = result["word_segments"]
+        starts = np.empty(len(word_segments))
+        ends = np.empty(len(word_segments))
+        spk_ids = np.empty(len(word_segments), dtype=np.int32)
+        texts = [None] * len(word_segments)
+        speaker_ids = {}
+        get = dict.get
+        n_words = 0
+        for word in word_segments:
+            # Use 'word' key instead of 'text' if that's how it's structured
+            word_text = get(word, "word") or get(word, "text")
+            if not word_text:  # Only keep words that have text
+                continue
+            speaker = get(word, "speaker", "SPEAKER_UNKNOWN")
+            spk_ids[n_words] = speaker_ids.setdefault(speaker, len(speaker_ids))
+            starts[n_words] = get(word, "start", 0)
+            ends[n_words] = get(word, "end", 0)
+            texts[n_words] = word_text
+            n_words += 1
+        spk_ids = spk_ids[:n_words]
+
+        # Create final segments from grouped words, joining each speaker's text once
         final_segments = []
-        for speaker, words in grouped.items():
-            if words:  # Check if there are any words for this speaker
-                start = words[0]["start"]
-                end = words[-1]["end"]
-                text = " ".join(w["text"] for w in words)
-                final_segments.append({
-                    "speaker": speaker,
-                    "start": start,
-                    "end": end,
-                    "text": text
-                })
+        for speaker, speaker_id in speaker_ids.items():
+            idx = np.flatnonzero(spk_ids == speaker_id)
+            final_segments.append({
+                "speaker": speaker,
+                "start": float(starts[idx[0]]),
+                "end": float(ends[idx[-1]]),
+                "text": " ".join([texts[i] for i in idx.tolist()])
+            })
 
         # Merge close segments from the same speaker
         final_segments = merge_close_segments(final_segments)
@@ -247,7 +319,9 @@ def main():
     try:
         output_md = filename.replace(".wav", ".md")
         print(f"[INFO] Writing Markdown transcript to {output_md}...")
-        with open(output_md, "w", encoding="utf-8") as f:
+        # Look up each speaker's confidence once rather than per segment
+        confidence_by_speaker = {speaker: stats['confidence'] for speaker, stats in speaker_stats.items()}
+        with open(output_md, "w", encoding="utf-8", buffering=1 << 16) as f:
             f.write(f"# Transcript – {datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}\n\n")
             
             # Add speaker statistics to the transcript
@@ -259,20 +333,98 @@ def main():
                 f.write(f"  - Confidence: {stats['confidence']:.2%}\n\n")
             
             f.write("## Transcript\n\n")
-            for segment in final_segments:
-                speaker = segment.get("speaker", "Speaker ?")
-                start = segment["start"]
-                end = segment["end"]
-                text = segment["text"].strip()
-                confidence = speaker_stats[speaker]['confidence']
-                f.write(f"### {speaker} ({start:.2f}s – {end:.2f}s) [Confidence: {confidence:.2%}]\n\n{text}\n\n")
+            f.writelines(
+                f"### {segment['speaker']} ({segment['start']:.2f}s – {segment['end']:.2f}s) "
+                f"[Confidence: {confidence_by_speaker[segment['speaker']]:.2%}]\n\n"
+                f"{segment['text'].strip()}\n\n"
+                for segment in final_segments
+            )
         print("[SUCCESS] Markdown transcript saved.")
     except Exception as e:
         print(f"[ERROR] Failed to save markdown file: {e}")
         sys.exit(1)
 
+    print(f"[DONE] Finished {filename}.")
+
+def transcribe_files(input_files):
+    """Transcribe a list of WAV files, loading every model only once"""
+    print(f"[DEBUG] Input files: {len(input_files)}")
+    print(f"[DEBUG] Using Whisper model: {MODEL_SIZE} on device: {DEVICE} ({COMPUTE_TYPE})")
+
+    # === Load models once and reuse them for every file ===
+    try:
+        print("[INFO] Loading faster-whisper model...")
+        model = WhisperModel(MODEL_SIZE, device=DEVICE, compute_type=COMPUTE_TYPE, cpu_threads=os.cpu_count())
+        print("[INFO] Loading alignment model...")
+        load_align_model("en", DEVICE)
+        print("[INFO] Loading diarization pipeline...")
+        # Initialize pipeline without speaker parameters
+        diarization_pipeline = DiarizationPipeline(use_auth_token=HF_TOKEN, device=torch.device(DEVICE))
+        # Batch the segmentation and embedding inference of the underlying pyannote pipeline
+        diarization_pipeline.model.segmentation_batch_size = DIARIZATION_CONFIG['segmentation_batch_size']
+        diarization_pipeline.model.embedding_batch_size = DIARIZATION_CONFIG['embedding_batch_size']
+        if DIARIZATION_CONFIG['cache_segmentation']:
+            cache_segmentations(diarization_pipeline)
+    except Exception as e:
+        print(f"[ERROR] Failed to load models: {e}")
+        sys.exit(1)
+
+    # A failing file must not abandon the rest of the batch. Each stage of
+    # transcribe_file reports its own error and exits, so SystemExit is caught here too.
+    failed = []
+    for filename in input_files:
+        try:
+            transcribe_file(filename, model, diarization_pipeline)
+        except (Exception, SystemExit) as e:
+            if not isinstance(e, SystemExit):
+                print(f"[ERROR] Transcription of {filename} failed: {e}")
+            print(f"[WARNING] Skipping {filename}, continuing with the remaining files.")
+            failed.append(filename)
+
+    if failed:
+        print(f"[ERROR] {len(failed)} of {len(input_files)} files failed:")
+        for filename in failed:
+            print(f"  - {filename}")
+        sys.exit(1)
+
     print("[DONE] All steps completed successfully.")
 
+def main():
+    # Set up command line argument parsing
+    parser = argparse.ArgumentParser(
+        description='Transcribe WAV file with speaker diarization'
+    )
+    parser.add_argument(
+        'input_file',
+        nargs='?',
+        help='Path to the WAV file to transcribe'
+    )
+    parser.add_argument(
+        '--batch',
+        nargs='+',
+        default=[],
+        metavar='WAV',
+        help='Transcribe several WAV files, loading the models only once'
+    )
+    args = parser.parse_args()
+
+    input_files = ([args.input_file] if args.input_file else []) + args.batch
+    if not input_files:
+        parser.error("an input file or --batch files are required")
+
+    # Validate input files
+    for input_file in input_files:
+        if not os.path.exists(input_file):
+            print(f"[ERROR] File not found: {input_file}")
+            sys.exit(1)
+        if not input_file.endswith('.wav'):
+            print(f"[ERROR] File must be a WAV file: {input_file}")
+            sys.exit(1)
+
+    print("[DEBUG] Script started.")
+    print(f"[DEBUG] Current working directory: {os.getcwd()}")
+    transcribe_files(input_files)
+
 if __name__ == "__main__":
     main()
 
@@ -24,16 +24,16 @@ Creates a Markdown file with:
 """
 
 import whisperx
+import torch
 import datetime
 import sounddevice as sd
-from scipy.io.wavfile import write
 import os
 import sys
 import time
 from whisperx.diarize import DiarizationPipeline
-from collections import defaultdict
 from dotenv import load_dotenv
 import argparse
+import numpy as np
 
 # Load environment variables
 load_dotenv()
@@ -44,7 +44,13 @@ if not HF_TOKEN:
 
 # === Configuration ===
 MODEL_SIZE = "medium"
-DEVICE = "cpu"
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+COMPUTE_TYPE = "float16" if DEVICE == "cuda" else "float32"
+SEGMENTATION_BATCH_SIZE = 32  # Sliding windows per diarization segmentation forward pass
+EMBEDDING_BATCH_SIZE = 64     # Speaker embeddings per diarization forward pass
+BATCH_SIZE = 16               # Audio chunks per Whisper forward pass
+# Greedy decoding: one hypothesis per chunk instead of WhisperX's default beam of 5
+ASR_OPTIONS = {"beam_size": 1, "best_of": 1, "condition_on_previous_text": False}
 
 def main():
     # Set up command line argument parsing
@@ -68,17 +74,18 @@ def main():
     print("[DEBUG] Script started.")
     print(f"[DEBUG] Current working directory: {os.getcwd()}")
     print(f"[DEBUG] Input file: {args.input_file}")
-    print(f"[DEBUG] Using Whisper model: {MODEL_SIZE} on device: {DEVICE}")
+    print(f"[DEBUG] Using Whisper model: {MODEL_SIZE} on device: {DEVICE} ({COMPUTE_TYPE})")
 
     # Replace the filename variable with args.input_file
     filename = args.input_file
 
-    # === Load WhisperX model and transcribe (float32 for CPU) ===
+    # === Load WhisperX model and transcribe (float16 on GPU, float32 on CPU) ===
     try:
         print("[INFO] Loading WhisperX model...")
-        model = whisperx.load_model(MODEL_SIZE, device=DEVICE, compute_type="float32")
+        model = whisperx.load_model(MODEL_SIZE, device=DEVICE, compute_type=COMPUTE_TYPE, asr_options=ASR_OPTIONS)
         print("[INFO] Transcribing audio...")
-        result = model.transcribe(filename)
+        # Setting the language skips the detection pass over the first 30s
+        result = model.transcribe(filename, batch_size=BATCH_SIZE, language="en")
         print("[DEBUG] Transcription result (first 3 segments):")
         for seg in result['segments'][:3]:
             print(f"  -> {seg['start']:.2f}s - {seg['end']:.2f}s: {seg['text']}")
@@ -101,7 +108,10 @@ def main():
     try:
         print("[INFO] Running diarization...")
         # Initialize pipeline
-        diarization_pipeline = DiarizationPipeline(use_auth_token=HF_TOKEN, device=DEVICE)
+        diarization_pipeline = DiarizationPipeline(use_auth_token=HF_TOKEN, device=torch.device(DEVICE))
+        # Batch the segmentation and embedding inference of the underlying pyannote pipeline
+        diarization_pipeline.model.segmentation_batch_size = SEGMENTATION_BATCH_SIZE
+        diarization_pipeline.model.embedding_batch_size = EMBEDDING_BATCH_SIZE
         diarization_segments = diarization_pipeline(filename)
         print(f"[DEBUG] Diarization complete. Found {len(diarization_segments)} speaker segments.")
     except Exception as e:
@@ -123,34 +133,42 @@ def main():
 
         if not isinstance(result["word_segments"], list):
             raise TypeError("Expected word_segments to be a list")
-
-        # Group words by speaker
-        grouped = defaultdict(list)
-        for word in result["word_segments"]:
-            if isinstance(word, dict):
-                speaker = word.get("speaker", "SPEAKER_UNKNOWN")
-                # Use 'word' key instead of 'text' if that's how it's structured
-                word_text = word.get("word", "") or word.get("text", "")
-                if word_text:  # Only append if we have text
-                    grouped[speaker].append({
-                        "start": word.get("start", 0),
-                        "end": word.get("end", 0),
-                        "text": word_text
-                    })
-
-        # Create final segments from grouped words
+        # The list is homogeneous, so check the element type once instead of per word
+        if not isinstance(result["word_segments"][0], dict):
+            raise TypeError("Expected word_segments to contain dicts")
+
+        # Group words by speaker into parallel arrays, one row per word
+        word_segments = result["word_segments"]
+        starts = np.empty(len(word_segments))
+        ends = np.empty(len(word_segments))
+        spk_ids = np.empty(len(word_segments), dtype=np.int32)
+        texts = [None] * len(word_segments)
+        speaker_ids = {}
+        get = dict.get
+        n_words = 0
+        for word in word_segments:
+            # Use 'word' key instead of 'text' if that's how it's structured
+            word_text = get(word, "word") or get(word, "text")
+            if not word_text:  # Only keep words that have text
+                continue
+            speaker = get(word, "speaker", "SPEAKER_UNKNOWN")
+            spk_ids[n_words] = speaker_ids.setdefault(speaker, len(speaker_ids))
+            starts[n_words] = get(word, "start", 0)
+            ends[n_words] = get(word, "end", 0)
+            texts[n_words] = word_text
+            n_words += 1
+        spk_ids = spk_ids[:n_words]
+
+        # Create final segments from grouped words, joining each speaker's text once
         final_segments = []
-        for speaker, words in grouped.items():
-            if words:  # Check if there are any words for this speaker
-                start = words[0]["start"]
-                end = words[-1]["end"]
-                text = " ".join(w["text"] for w in words)
-                final_segments.append({
-                    "speaker": speaker,
-                    "start": start,
-                    "end": end,
-                    "text": text
-                })
+        for speaker, speaker_id in speaker_ids.items():
+            idx = np.flatnonzero(spk_ids == speaker_id)
+            final_segments.append({
+                "speaker": speaker,
+                "start": float(starts[idx[0]]),
+                "end": float(ends[idx[-1]]),
+                "text": " ".join([texts[i] for i in idx.tolist()])
+            })
 
         if final_segments:
             print("[DEBUG] First speaker-labeled segment:")
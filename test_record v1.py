@@ -2,11 +2,10 @@
 # Audio Recording Test Script v1
 
 Simple test script to record audio using sounddevice and save as WAV file.
-Includes interactive countdown and early stop support.
+Includes early stop support.
 
 ## Features
-- Records mono audio at CD quality (44.1kHz)
-- Shows interactive countdown during recording
+- Records mono 16-bit audio at CD quality (44.1kHz)
 - Allows early stopping with Ctrl+C
 - Saves WAV files with timestamps
 - Organized file storage in 'recordings' folder
@@ -23,10 +22,10 @@ recordings/record_YYYYMMDD_HHMMSS.wav
 
 import os
 import sys
-import time
+import struct
 import datetime
 import sounddevice as sd
-from scipy.io.wavfile import write
+import numpy as np
 
 # === Configuration ===
 SAMPLE_RATE = 44100  # CD quality
@@ -34,6 +33,17 @@ DURATION = 5         # seconds
 CHANNELS = 1         # mono
 RECORDINGS_DIR = "recordings"  # recordings folder name
 
+def write_wav(fh, rate, data):
+    """Write int16 samples to an open file as a PCM WAV"""
+    data = np.ascontiguousarray(data, dtype=np.int16)
+    n_bytes = data.nbytes
+    channels = 1 if data.ndim == 1 else data.shape[1]
+    # 44-byte RIFF header: RIFF chunk, 16-byte fmt chunk, data chunk header
+    fh.write(b'RIFF' + struct.pack('<I', 36 + n_bytes) + b'WAVEfmt '
+             + struct.pack('<IHHIIHH', 16, 1, channels, rate, rate * channels * 2, channels * 2, 16)
+             + b'data' + struct.pack('<I', n_bytes))
+    data.tofile(fh)
+
 # Create recordings directory if it doesn't exist
 try:
     os.makedirs(RECORDINGS_DIR, exist_ok=True)
@@ -52,21 +62,13 @@ filename = os.path.join(RECORDINGS_DIR, f"record_{now}.wav")
 print(f"[DEBUG] Output audio filename: {filename}")
 
 
-# === Record Audio with interactive countdown ===
+# === Record Audio ===
 try:
     duration = DURATION
     print(f"[INFO] Recording for {DURATION} seconds... Press Ctrl+C to stop early.")
-    start_time = time.time()
-    audio = sd.rec(int(duration * SAMPLE_RATE), samplerate=SAMPLE_RATE, channels=CHANNELS)
-    while True:
-        elapsed = int(time.time() - start_time)
-        remaining = int(duration - elapsed)
-        if remaining <= 0:
-            break
-        print(f"\r[RECORDING] {elapsed}s elapsed, {remaining}s remaining", end="")
-        time.sleep(1)
+    audio = sd.rec(int(duration * SAMPLE_RATE), samplerate=SAMPLE_RATE, channels=CHANNELS, dtype="int16")
     sd.wait()
-    print("\n[INFO] Recording complete.")
+    print("[INFO] Recording complete.")
 except KeyboardInterrupt:
     print("\n[WARNING] Recording manually interrupted! Saving partial audio...")
     sd.stop()
@@ -76,7 +78,9 @@ except Exception as e:
 
 # === Save WAV file ===
 try:
-    write(filename, SAMPLE_RATE, audio)
+    # A 1 MiB buffer lets the header and samples reach disk in a few large writes
+    with open(filename, "wb", buffering=1 << 20) as fh:
+        write_wav(fh, SAMPLE_RATE, audio)
     print(f"[INFO] Audio saved to {filename}")
     print(f"[DEBUG] Full path: {os.path.abspath(filename)}")
 except Exception as e:
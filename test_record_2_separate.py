@@ -6,7 +6,8 @@ Provides a command-line interface for controlling recordings.
 
 ## Features
 - Records microphone input (mono, 16kHz)
-- Records system audio output (stereo, 16kHz)
+- Records system audio output through WASAPI loopback (Windows, via PyAudioWPatch),
+  in the output device's own channels and mix rate
 - Saves separate WAV files for each audio source
 - Supports manual and timed recordings
 - Lists available audio devices
@@ -23,116 +24,212 @@ Saves in 'recordings' directory:
 - system_YYYYMMDD_HHMMSS.wav (system audio)
 """
 
-import pyaudio
-import wave
+try:
+    import pyaudiowpatch as pyaudio  # PyAudio fork that adds WASAPI loopback devices (Windows)
+except ImportError:
+    import pyaudio
+import asyncio
+import struct
 import threading
 import time
 import os
+from contextlib import ExitStack, contextmanager
 from datetime import datetime
 import sounddevice as sd
 import numpy as np
-import scipy.io.wavfile as wavfile
+
+# 44-byte PCM WAV header: RIFF chunk, 16-byte fmt chunk, data chunk header
+WAV_HEADER = struct.Struct('<4sI4s4sIHHIIHH4sI')
+
+def _write_wav_header(fh, channels, rate, bits=16):
+    """Write a WAV header with placeholder sizes, fixed by _patch_wav_header"""
+    block_align = channels * bits // 8
+    fh.write(WAV_HEADER.pack(b'RIFF', 0xFFFFFFFF, b'WAVE', b'fmt ', 16, 1, channels, rate,
+                             rate * block_align, block_align, bits, b'data', 0xFFFFFFFF))
+
+def _patch_wav_header(fh):
+    """Fill in the RIFF and data sizes once all PCM has been written"""
+    data_size = fh.tell() - WAV_HEADER.size
+    fh.seek(4)
+    fh.write(struct.pack('<I', data_size + 36))
+    fh.seek(40)
+    fh.write(struct.pack('<I', data_size))
 
 class MeetingRecorder:
     def __init__(self):
-        self.chunk = 1024
-        self.format = pyaudio.paInt16
+        self.dtype = np.int16  # 16-bit PCM for both microphone and system audio
+        self._sample_width = np.dtype(self.dtype).itemsize
+        self._threads = []
+        self._devices_cache = None  # sd.query_devices() result, refreshed on request
+        # System audio is captured through PyAudio, the microphone through sounddevice
+        self._pa = pyaudio.PyAudio()
+        self._loopback = self._find_loopback_device()
         self.channels = 1 
         self.rate = 16000
+        self.chunk = self._low_latency_chunk()  # Frames per stream read/callback
         self.recording = False
-        self.frames_mic = []
-        self.frames_system = []
         self.recordings_dir = "recordings"
         
         # Create recordings directory if it doesn't exist
         try:
             os.makedirs(self.recordings_dir, exist_ok=True)
-            print(f"[INFO] Using recordings directory: {os.path.abspath(self.recordings_dir)}")
+            self._recordings_dir_abs = os.path.abspath(self.recordings_dir)
+            print(f"[INFO] Using recordings directory: {self._recordings_dir_abs}")
         except Exception as e:
             print(f"[ERROR] Failed to create recordings directory: {e}")
             raise
     
-    def list_audio_devices(self):
-        """List all available audio devices"""
+    @contextmanager
+    def _open_wav(self, filename, channels, rate):
+        """Open a WAV file for streaming raw PCM chunks into it"""
+        # Raw PCM goes straight into a 1 MiB buffered file; the header is written up
+        # front and its sizes patched on close, even if recording fails part way
+        with open(filename, 'wb', buffering=1 << 20) as fh:
+            _write_wav_header(fh, channels, rate, bits=8 * self._sample_width)
+            try:
+                yield fh
+            finally:
+                _patch_wav_header(fh)
+    
+    def _low_latency_chunk(self):
+        """Block size matching the input device's low-latency period, as a power of two"""
+        try:
+            latency = sd.query_devices(kind='input')['default_low_input_latency']
+        except Exception as e:
+            print(f"[WARNING] Could not query the input device latency ({e}), using 1024-frame blocks")
+            return 1024
+        # Round down to a power of two, at least 32 frames
+        return 1 << max(5, int(max(1, self.rate * latency)).bit_length() - 1)
+    
+    def _find_loopback_device(self):
+        """Resolve the WASAPI loopback device of the default output, or None if there is none"""
+        # Only PyAudioWPatch exposes loopback devices; plain PyAudio and sounddevice can't
+        if not hasattr(self._pa, "get_loopback_device_info_generator"):
+            print("[WARNING] System audio capture needs PyAudioWPatch (Windows WASAPI loopback); "
+                  "recording the microphone only")
+            return None
+        try:
+            wasapi = self._pa.get_host_api_info_by_type(pyaudio.paWASAPI)
+        except OSError as e:
+            print(f"[WARNING] WASAPI unavailable ({e}); recording the microphone only")
+            return None
+        speakers = self._pa.get_device_info_by_index(wasapi["defaultOutputDevice"])
+        if speakers["isLoopbackDevice"]:
+            return speakers
+        for loopback in self._pa.get_loopback_device_info_generator():
+            if speakers["name"] in loopback["name"]:
+                return loopback
+        print(f"[WARNING] No loopback device for {speakers['name']}; recording the microphone only")
+        return None
+    
+    def list_audio_devices(self, refresh=False):
+        """List all available audio devices, querying PortAudio only on first use or refresh"""
+        if refresh or self._devices_cache is None:
+            self._devices_cache = sd.query_devices()
         print("Available audio devices:")
-        devices = sd.query_devices()
-        for i, device in enumerate(devices):
+        for i, device in enumerate(self._devices_cache):
             print(f"{i}: {device['name']} - {device['max_input_channels']} in, {device['max_output_channels']} out")
-        return devices
+        return self._devices_cache
+    
+    async def _write_wav(self, blocks, filename, channels, rate):
+        """Write queued blocks to a WAV file until the None sentinel arrives"""
+        # Write each block as it arrives so memory use doesn't grow with the recording
+        with self._open_wav(filename, channels, rate) as fh:
+            while True:
+                block = await blocks.get()
+                if block is None:
+                    break
+                fh.write(block)
     
-    def record_microphone(self, filename):
-        """Record from microphone"""
-        audio = pyaudio.PyAudio()
+    async def _capture(self, mic_filename, system_filename):
+        """Capture microphone and system audio on one event loop"""
+        loop = asyncio.get_running_loop()
+        mic_blocks = asyncio.Queue()
+        system_blocks = asyncio.Queue()
         
-        # Find default input device
+        def enqueue(blocks, source):
+            # PortAudio calls this on its own thread; the block is copied out of the
+            # stream buffer and handed to the loop, which owns the queue
+            def callback(indata, frames, time_info, status):
+                if status:
+                    print(f"{source} recording status: {status}")
+                loop.call_soon_threadsafe(blocks.put_nowait, bytes(indata))
+            return callback
+        
+        def system_callback(in_data, frame_count, time_info, status):
+            # PyAudio already hands over its own bytes copy of the block
+            if status:
+                print(f"System audio recording status: {status}")
+            loop.call_soon_threadsafe(system_blocks.put_nowait, in_data)
+            return (None, pyaudio.paContinue)
+        
+        writers = {}
         try:
-            stream = audio.open(
-                format=self.format,
-                channels=1,  # Mono for microphone
-                rate=self.rate,
-                input=True,
-                frames_per_buffer=self.chunk
-            )
-            
-            print("Recording microphone...")
-            while self.recording:
-                data = stream.read(self.chunk, exception_on_overflow=False)
-                self.frames_mic.append(data)
-            
-            stream.stop_stream()
-            stream.close()
-            
-            # Save microphone recording
-            wf = wave.open(filename, 'wb')
-            wf.setnchannels(1)
-            wf.setsampwidth(audio.get_sample_size(self.format))
-            wf.setframerate(self.rate)
-            wf.writeframes(b''.join(self.frames_mic))
-            wf.close()
-            
-        except Exception as e:
-            print(f"Error recording microphone: {e}")
+            # Keep both streams open for the whole recording instead of restarting
+            # them per chunk, which cost setup time and dropped audio between chunks.
+            # They are opened separately so a system-audio failure doesn't stop the mic.
+            with ExitStack() as streams:
+                streams.enter_context(sd.RawInputStream(
+                    samplerate=self.rate,
+                    channels=1,  # Mono for microphone
+                    dtype=self.dtype,
+                    blocksize=self.chunk,
+                    callback=enqueue(mic_blocks, "Microphone")
+                ))
+                writers[mic_blocks] = asyncio.create_task(
+                    self._write_wav(mic_blocks, mic_filename, 1, self.rate))
+                
+                if self._loopback:
+                    # Shared-mode WASAPI only captures at the output's mix rate and in all
+                    # of its channels, so the system file is written in that format
+                    channels = self._loopback["maxInputChannels"]
+                    rate = int(self._loopback["defaultSampleRate"])
+                    try:
+                        system_stream = self._pa.open(
+                            format=pyaudio.paInt16,
+                            channels=channels,
+                            rate=rate,
+                            input=True,
+                            input_device_index=self._loopback["index"],
+                            frames_per_buffer=self.chunk,
+                            stream_callback=system_callback
+                        )
+                        streams.callback(system_stream.close)
+                        streams.callback(system_stream.stop_stream)
+                        writers[system_blocks] = asyncio.create_task(
+                            self._write_wav(system_blocks, system_filename, channels, rate))
+                        print("Recording microphone and system audio...")
+                    except Exception as e:
+                        print(f"[ERROR] System audio capture failed to start: {e}")
+                        print("Recording microphone only...")
+                else:
+                    print("Recording microphone only...")
+                
+                while self.recording:
+                    await asyncio.sleep(0.1)
         finally:
-            audio.terminate()
+            # Blocks delivered while the streams were closing are still waiting as
+            # call_soon_threadsafe callbacks; scheduling the sentinels with call_soon
+            # queues them behind those, so the writers see every last block
+            for blocks in writers:
+                loop.call_soon(blocks.put_nowait, None)
+            await asyncio.gather(*writers.values())
     
-    def record_system_audio(self, filename):
-        """Record system audio using sounddevice (works better for system audio)"""
+    def _run_capture(self, mic_filename, system_filename):
+        """Thread target running the capture event loop"""
         try:
-            print("Recording system audio...")
-            
-            # Get system audio (this requires specific setup depending on OS)
-            duration_chunk = 0.1  # Record in small chunks
-            system_audio = []
-            
-            while self.recording:
-                # Record system audio - this may need adjustment based on your system
-                try:
-                    # Use loopback device if available (Windows) or soundflower (Mac)
-                    audio_chunk = sd.rec(
-                        int(self.rate * duration_chunk), 
-                        samplerate=self.rate, 
-                        channels=2,
-                        device=None  # Use default output device
-                    )
-                    sd.wait()
-                    system_audio.append(audio_chunk)
-                except Exception as e:
-                    print(f"System audio recording error: {e}")
-                    time.sleep(duration_chunk)
-            
-            if system_audio:
-                # Combine all chunks
-                full_audio = np.concatenate(system_audio, axis=0)
-                wavfile.write(filename, self.rate, full_audio)
-                
+            asyncio.run(self._capture(mic_filename, system_filename))
         except Exception as e:
-            print(f"Error recording system audio: {e}")
+            self.recording = False
+            print(f"Error recording audio: {e}")
     
-    def get_recording_path(self, prefix="meeting"):
+    def get_recording_path(self, prefix="meeting", ts=None):
         """Generate a timestamped filepath in the recordings directory"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # Callers writing several files pass one ts so the filenames pair up
+        timestamp = ts or datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"{prefix}_{timestamp}.wav"
-        return os.path.join(self.recordings_dir, filename)
+        # Built on the absolute directory resolved in __init__, so it needs no abspath
+        return os.path.join(self._recordings_dir_abs, filename)
     
     def start_recording(self, output_dir=None):
         """Start recording both microphone and system audio"""
@@ -143,29 +240,28 @@ class MeetingRecorder:
         # Use default recordings directory if none specified
         output_dir = output_dir or self.recordings_dir
         
-        # Ensure output directory exists
-        os.makedirs(output_dir, exist_ok=True)
+        # The default directory was already created in __init__
+        if output_dir != self.recordings_dir:
+            os.makedirs(output_dir, exist_ok=True)
         
         # Generate filenames with timestamp
-        mic_filename = self.get_recording_path(prefix="mic")
-        system_filename = self.get_recording_path(prefix="system")
+        # One timestamp for both files, even if the second ticks over between them
+        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+        mic_filename = self.get_recording_path(prefix="mic", ts=ts)
+        system_filename = self.get_recording_path(prefix="system", ts=ts)
         
         print(f"[INFO] Starting recording...")
-        print(f"[DEBUG] Microphone recording path: {os.path.abspath(mic_filename)}")
-        print(f"[DEBUG] System audio recording path: {os.path.abspath(system_filename)}")
+        print(f"[DEBUG] Microphone recording path: {mic_filename}")
+        print(f"[DEBUG] System audio recording path: {system_filename}")
         
         self.recording = True
-        self.frames_mic = []
-        self.frames_system = []
         
-        # Start recording threads
-        mic_thread = threading.Thread(target=self.record_microphone, args=(mic_filename,))
-        system_thread = threading.Thread(target=self.record_system_audio, args=(system_filename,))
+        # One thread runs the event loop that serves both streams
+        capture_thread = threading.Thread(target=self._run_capture, args=(mic_filename, system_filename))
+        capture_thread.start()
         
-        mic_thread.start()
-        system_thread.start()
-        
-        return [mic_thread, system_thread]
+        self._threads = [capture_thread]
+        return self._threads
     
     def stop_recording(self):
         """Stop recording"""
@@ -189,6 +285,12 @@ class MeetingRecorder:
                 thread.join()
             
             print("Recording completed!")
+    
+    def close(self):
+        """Wait for the recording thread to finish writing its files, then release PortAudio"""
+        for thread in self._threads:
+            thread.join()
+        self._pa.terminate()
 
 def main():
     recorder = MeetingRecorder()
@@ -206,8 +308,9 @@ def main():
         print("3. Record for specific duration")
         print("4. List audio devices")
         print("5. Exit")
+        print("6. Refresh audio devices")
         
-        choice = input("\nEnter your choice (1-5): ").strip()
+        choice = input("\nEnter your choice (1-6): ").strip()
         
         if choice == '1':
             try:
@@ -234,9 +337,13 @@ def main():
         elif choice == '5':
             if recorder.recording:
                 recorder.stop_recording()
+            recorder.close()
             print("Goodbye!")
             break
         
+        elif choice == '6':
+            recorder.list_audio_devices(refresh=True)
+        
         else:
             print("Invalid choice. Please try again.")
 
@@ -7,7 +7,8 @@ with both local speaker and remote participant audio.
 
 ## Features
 - Records and mixes microphone and system audio
-- Saves as 16kHz mono WAV file (optimized for transcription)
+- Captures system audio through WASAPI loopback (Windows, via PyAudioWPatch)
+- Saves as mono WAV at the output device's mix rate (16kHz without loopback)
 - Interactive command-line interface
 - Supports manual and timed recordings
 - Lists available audio devices
@@ -23,130 +24,316 @@ Saves in 'recordings' directory:
 meeting_combined_YYYYMMDD_HHMMSS.wav (mixed audio)
 """
 
-import pyaudio
-import wave
+try:
+    import pyaudiowpatch as pyaudio  # PyAudio fork that adds WASAPI loopback devices (Windows)
+except ImportError:
+    import pyaudio
+import struct
 import threading
 import time
 import os
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime
 import sounddevice as sd
 import numpy as np
-import scipy.io.wavfile as wavfile
+from numba import njit, types
+
+# 44-byte PCM WAV header: RIFF chunk, 16-byte fmt chunk, data chunk header
+WAV_HEADER = struct.Struct('<4sI4s4sIHHIIHH4sI')
+
+def _write_wav_header(fh, channels, rate, bits=16):
+    """Write a WAV header with placeholder sizes, fixed by _patch_wav_header"""
+    block_align = channels * bits // 8
+    fh.write(WAV_HEADER.pack(b'RIFF', 0xFFFFFFFF, b'WAVE', b'fmt ', 16, 1, channels, rate,
+                             rate * block_align, block_align, bits, b'data', 0xFFFFFFFF))
+
+def _patch_wav_header(fh):
+    """Fill in the RIFF and data sizes once all PCM has been written"""
+    data_size = fh.tell() - WAV_HEADER.size
+    fh.seek(4)
+    fh.write(struct.pack('<I', data_size + 36))
+    fh.seek(40)
+    fh.write(struct.pack('<I', data_size))
+
+# Compiled eagerly for the exact buffers the recorder passes: the read-only mono mic chunk
+# np.frombuffer wraps around PyAudio's bytes, the C-ordered (frames, channels) _sys_chunk
+# that _ring_read fills (as many channels as the loopback device has) and the contiguous mix buffer
+@njit(types.void(types.Array(types.int16, 1, 'C', readonly=True), types.int16[:, ::1], types.int16[::1]),
+      cache=True, boundscheck=False, error_model='numpy')
+def mix_i16(mic, sys, out):
+    """Mix mono mic samples with multichannel system samples into int16 in a single pass"""
+    channels = sys.shape[1]
+    for i in range(mic.shape[0]):
+        # Downmix the system channels by averaging, add the mic, then saturate
+        acc = np.int32(0)
+        for c in range(channels):
+            acc += np.int32(sys[i, c])
+        v = np.int32(mic[i]) + acc // channels
+        if v > 32767:
+            v = 32767
+        elif v < -32768:
+            v = -32768
+        out[i] = v
 
 class MeetingRecorder:
     def __init__(self):
-        self.chunk = 1024
         self.format = pyaudio.paInt16
+        self.dtype = np.int16  # Same 16-bit PCM as self.format, for NumPy views of stream data
+        # One PortAudio host for the recorder's lifetime instead of one per recording
+        self._pa = pyaudio.PyAudio()
+        self._sample_width = self._pa.get_sample_size(self.format)
+        self._threads = []
+        self._devices_cache = None  # sd.query_devices() result, refreshed on request
+        self._loopback = self._find_loopback_device()
         self.channels = 1  # Mono for all audio
-        self.rate = 16000  # Changed from 441000 to standard 16kHz
+        if self._loopback:
+            # Shared-mode WASAPI only captures at the output's mix rate (44.1/48 kHz) and in
+            # all of its channels, so the mic is recorded and mixed at that rate too
+            self.rate = int(self._loopback["defaultSampleRate"])
+            self._system_channels = self._loopback["maxInputChannels"]
+        else:
+            self.rate = 16000  # Changed from 441000 to standard 16kHz
+            self._system_channels = 1
+        self.chunk = self._low_latency_chunk()  # Frames per stream read/callback
         self.recording = False
-        self.frames_mic = []
-        self.frames_system = []
         self.recordings_dir = "recordings"
         
+        # Combined recording works in ~100ms chunks, a whole number of stream blocks so
+        # mic and system reads stay aligned; its buffers are reused for every chunk
+        self.samples_per_chunk = max(1, round(self.rate * 0.1 / self.chunk)) * self.chunk
+        self._mix_i16 = np.empty(self.samples_per_chunk, dtype=np.int16)
+        
+        # System audio ring filled by the stream callback and drained by the mixing loop.
+        # Head and tail count frames ever written/read; each side only advances its own
+        # counter, so one producer and one consumer need no lock. Blocks dropped while the
+        # ring is full are queued as (position, frames) gaps that the consumer fills with
+        # silence, so system audio stays aligned with the mic after a drop.
+        self._ring = np.empty((32 * self.samples_per_chunk, self._system_channels), dtype=self.dtype)
+        self._ring_head = 0
+        self._ring_tail = 0
+        self._ring_gaps = deque()
+        self._gap_used = 0  # Frames of the first gap already padded
+        self._ring_ready = threading.Event()  # Set by the callback whenever head or gaps move
+        self._sys_chunk = np.empty((self.samples_per_chunk, self._system_channels), dtype=self.dtype)
+        
         # Create recordings directory if it doesn't exist
         try:
             os.makedirs(self.recordings_dir, exist_ok=True)
-            print(f"[INFO] Using recordings directory: {os.path.abspath(self.recordings_dir)}")
+            self._recordings_dir_abs = os.path.abspath(self.recordings_dir)
+            print(f"[INFO] Using recordings directory: {self._recordings_dir_abs}")
         except Exception as e:
             print(f"[ERROR] Failed to create recordings directory: {e}")
             raise
     
-    def get_recording_path(self, prefix="meeting"):
+    def get_recording_path(self, prefix="meeting", ts=None):
         """Generate a timestamped filepath in the recordings directory"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # Callers writing several files pass one ts so the filenames pair up
+        timestamp = ts or datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"{prefix}_{timestamp}.wav"
-        return os.path.join(self.recordings_dir, filename)
+        # Built on the absolute directory resolved in __init__, so it needs no abspath
+        return os.path.join(self._recordings_dir_abs, filename)
         
-    def list_audio_devices(self):
-        """List all available audio devices"""
+    @contextmanager
+    def _open_wav(self, filename, channels):
+        """Open a WAV file for streaming raw PCM chunks into it"""
+        # Raw PCM goes straight into a 1 MiB buffered file; the header is written up
+        # front and its sizes patched on close, even if recording fails part way
+        with open(filename, 'wb', buffering=1 << 20) as fh:
+            _write_wav_header(fh, channels, self.rate, bits=8 * self._sample_width)
+            try:
+                yield fh
+            finally:
+                _patch_wav_header(fh)
+    
+    def _low_latency_chunk(self):
+        """Block size matching the input device's low-latency period, as a power of two"""
+        try:
+            latency = sd.query_devices(kind='input')['default_low_input_latency']
+        except Exception as e:
+            print(f"[WARNING] Could not query the input device latency ({e}), using 1024-frame blocks")
+            return 1024
+        # Round down to a power of two, at least 32 frames
+        return 1 << max(5, int(max(1, self.rate * latency)).bit_length() - 1)
+    
+    def _find_loopback_device(self):
+        """Resolve the WASAPI loopback device of the default output, or None if there is none"""
+        # Only PyAudioWPatch exposes loopback devices; plain PyAudio and sounddevice can't
+        if not hasattr(self._pa, "get_loopback_device_info_generator"):
+            print("[WARNING] System audio capture needs PyAudioWPatch (Windows WASAPI loopback); "
+                  "recording the microphone only")
+            return None
+        try:
+            wasapi = self._pa.get_host_api_info_by_type(pyaudio.paWASAPI)
+        except OSError as e:
+            print(f"[WARNING] WASAPI unavailable ({e}); recording the microphone only")
+            return None
+        speakers = self._pa.get_device_info_by_index(wasapi["defaultOutputDevice"])
+        if speakers["isLoopbackDevice"]:
+            return speakers
+        for loopback in self._pa.get_loopback_device_info_generator():
+            if speakers["name"] in loopback["name"]:
+                return loopback
+        print(f"[WARNING] No loopback device for {speakers['name']}; recording the microphone only")
+        return None
+    
+    def list_audio_devices(self, refresh=False):
+        """List all available audio devices, querying PortAudio only on first use or refresh"""
+        if refresh or self._devices_cache is None:
+            self._devices_cache = sd.query_devices()
         print("Available audio devices:")
-        devices = sd.query_devices()
-        for i, device in enumerate(devices):
+        for i, device in enumerate(self._devices_cache):
             print(f"{i}: {device['name']} - {device['max_input_channels']} in, {device['max_output_channels']} out")
-        return devices
+        return self._devices_cache
+    
+    def _mic_cb(self, in_data, frame_count, time_info, status):
+        """PyAudio callback: append one block of microphone audio to the open WAV"""
+        self._mic_file.write(in_data)
+        return (None, pyaudio.paContinue)
     
     def record_microphone(self, filename):
         """Record from microphone"""
-        audio = pyaudio.PyAudio()
-        
         # Find default input device
         try:
-            stream = audio.open(
-                format=self.format,
-                channels=1,  # Mono for microphone
-                rate=self.rate,
-                input=True,
-                frames_per_buffer=self.chunk
-            )
-            
-            print("Recording microphone...")
-            while self.recording:
-                data = stream.read(self.chunk, exception_on_overflow=False)
-                self.frames_mic.append(data)
-            
-            stream.stop_stream()
-            stream.close()
-            
-            # Save microphone recording
-            wf = wave.open(filename, 'wb')
-            wf.setnchannels(1)
-            wf.setsampwidth(audio.get_sample_size(self.format))
-            wf.setframerate(self.rate)
-            wf.writeframes(b''.join(self.frames_mic))
-            wf.close()
+            # Write each chunk as it arrives so memory use doesn't grow with the recording
+            with self._open_wav(filename, 1) as fh:
+                self._mic_file = fh
+                
+                # Callback mode: PortAudio's own thread delivers the blocks, so this
+                # thread no longer holds the GIL in a blocking read loop
+                stream = self._pa.open(
+                    format=self.format,
+                    channels=1,  # Mono for microphone
+                    rate=self.rate,
+                    input=True,
+                    frames_per_buffer=self.chunk,
+                    stream_callback=self._mic_cb
+                )
+                
+                print("Recording microphone...")
+                while self.recording:
+                    time.sleep(0.1)
+                
+                stream.stop_stream()
+                stream.close()
             
         except Exception as e:
             print(f"Error recording microphone: {e}")
-        finally:
-            audio.terminate()
     
     def record_system_audio(self, filename):
-        """Record system audio using sounddevice (works better for system audio)"""
+        """Record system audio from the WASAPI loopback device"""
+        if not self._loopback:
+            print("Error recording system audio: no loopback device")
+            return
         try:
             print("Recording system audio...")
             
-            # Get system audio (this requires specific setup depending on OS)
-            duration_chunk = 0.1  # Record in small chunks
-            system_audio = []
-            
-            while self.recording:
-                # Record system audio - this may need adjustment based on your system
+            with self._open_wav(filename, self._system_channels) as fh:
+                # The callback writes PyAudio's bytes straight to the WAV
+                def callback(in_data, frame_count, time_info, status):
+                    if status:
+                        print(f"System audio recording status: {status}")
+                    fh.write(in_data)
+                    return (None, pyaudio.paContinue)
+                
+                # Keep one stream open for the whole recording instead of restarting
+                # it per chunk, which cost setup time and dropped audio between chunks
+                stream = self._pa.open(
+                    format=self.format,
+                    channels=self._system_channels,
+                    rate=self.rate,
+                    input=True,
+                    input_device_index=self._loopback["index"],
+                    frames_per_buffer=self.chunk,
+                    stream_callback=callback
+                )
                 try:
-                    # Use loopback device if available (Windows) or soundflower (Mac)
-                    audio_chunk = sd.rec(
-                        int(self.rate * duration_chunk), 
-                        samplerate=self.rate, 
-                        channels=2,
-                        device=None  # Use default output device
-                    )
-                    sd.wait()
-                    system_audio.append(audio_chunk)
-                except Exception as e:
-                    print(f"System audio recording error: {e}")
-                    time.sleep(duration_chunk)
-            
-            if system_audio:
-                # Combine all chunks
-                full_audio = np.concatenate(system_audio, axis=0)
-                wavfile.write(filename, self.rate, full_audio)
+                    while self.recording:
+                        time.sleep(0.1)
+                finally:
+                    stream.stop_stream()
+                    stream.close()
                 
         except Exception as e:
             print(f"Error recording system audio: {e}")
     
+    def _ring_write(self, in_data, frame_count, time_info, status):
+        """PyAudio callback: append one block of system audio to the ring"""
+        if status:
+            print(f"System audio recording status: {status}")
+        indata = np.frombuffer(in_data, dtype=self.dtype).reshape(-1, self._system_channels)
+        frames = len(indata)
+        size = len(self._ring)
+        head = self._ring_head
+        if head - self._ring_tail + frames > size:
+            print("System audio ring buffer full, padding a dropped block with silence")
+            self._ring_gaps.append((head, frames))
+            self._ring_ready.set()
+            return (None, pyaudio.paContinue)
+        start = head % size
+        end = start + frames
+        if end <= size:
+            self._ring[start:end] = indata
+        else:
+            split = size - start
+            self._ring[start:] = indata[:split]
+            self._ring[:end - size] = indata[split:]
+        # Publish the frames only after they are in place
+        self._ring_head = head + frames
+        self._ring_ready.set()
+        return (None, pyaudio.paContinue)
+    
+    def _ring_read(self, out, timeout):
+        """Fill out with the next system frames, silence for dropped or late ones; False once stopped"""
+        size = len(self._ring)
+        filled = 0
+        deadline = time.monotonic() + timeout
+        while filled < len(out):
+            tail = self._ring_tail
+            if self._ring_gaps and self._ring_gaps[0][0] == tail:
+                # A dropped block sits here: pad it before any later frames
+                frames = self._ring_gaps[0][1]
+                n = min(frames - self._gap_used, len(out) - filled)
+                out[filled:filled + n] = 0
+                filled += n
+                self._gap_used += n
+                if self._gap_used == frames:
+                    self._ring_gaps.popleft()
+                    self._gap_used = 0
+                continue
+            
+            # Read head before the gaps: a gap queued after this point lies at or past it
+            limit = self._ring_head
+            if self._ring_gaps:
+                limit = min(limit, self._ring_gaps[0][0])
+            n = min(limit - tail, len(out) - filled, size - tail % size)
+            if n == 0:
+                if not self.recording:
+                    return False
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    # WASAPI loopback delivers nothing while the output is silent, so
+                    # whatever hasn't arrived in time is silence
+                    out[filled:] = 0
+                    return True
+                # Sleep until the callback delivers more
+                self._ring_ready.wait(remaining)
+                self._ring_ready.clear()
+                continue
+            start = tail % size
+            out[filled:filled + n] = self._ring[start:start + n]
+            filled += n
+            self._ring_tail = tail + n
+        return True
+    
     def record_combined_audio(self, filename):
         """Record both microphone and system audio into a single file"""
         try:
             print("Recording combined audio...")
             
-            # Initialize audio streams
-            audio = pyaudio.PyAudio()
+            samples_per_chunk = self.samples_per_chunk
             
-            # Calculate buffer sizes
-            duration_chunk = 0.1  # 100ms chunks
-            samples_per_chunk = int(self.rate * duration_chunk)
-            
-            mic_stream = audio.open(
+            mic_stream = self._pa.open(
                 format=self.format,
                 channels=self.channels,  # Mono
                 rate=self.rate,
@@ -154,46 +341,60 @@ class MeetingRecorder:
                 frames_per_buffer=samples_per_chunk
             )
             
-            # Initialize numpy arrays for combined audio
-            combined_audio = []
-            
-            while self.recording:
-                # Record system audio chunk first
-                sys_data = sd.rec(
-                    samples_per_chunk,
-                    samplerate=self.rate,
-                    channels=self.channels,  # Mono
-                    dtype=np.int16,
-                    device=None
+            # Mixed chunks go straight to the WAV, so nothing accumulates in memory.
+            # System audio streams continuously into the ring instead of one blocking
+            # read per chunk, which also left gaps between chunks.
+            sys_stream = None
+            if self._loopback:
+                self._ring_head = self._ring_tail = self._gap_used = 0
+                self._ring_gaps.clear()
+                self._ring_ready.clear()
+                sys_stream = self._pa.open(
+                    format=self.format,
+                    channels=self._system_channels,  # All of the output's channels
+                    rate=self.rate,
+                    input=True,
+                    input_device_index=self._loopback["index"],
+                    frames_per_buffer=self.chunk,
+                    stream_callback=self._ring_write
                 )
-                sd.wait()
-                
-                # Record microphone chunk of the same size
-                mic_data = np.frombuffer(
-                    mic_stream.read(samples_per_chunk, exception_on_overflow=False),
-                    dtype=np.int16
-                )
-                
-                # Both arrays are now mono, no need for reshaping
-                # Mix microphone and system audio with equal weights
-                mixed_data = np.clip(mic_data + sys_data.flatten(), -32768, 32767).astype(np.int16)
-                combined_audio.append(mixed_data)
+            else:
+                self._sys_chunk.fill(0)
+            chunk_seconds = samples_per_chunk / self.rate
             
-            # Cleanup streams
-            mic_stream.stop_stream()
-            mic_stream.close()
-            audio.terminate()
+            try:
+                with self._open_wav(filename, self.channels) as fh:
+                    while self.recording:
+                        # Record a microphone chunk; frombuffer wraps the returned bytes without copying
+                        mic_data = np.frombuffer(
+                            mic_stream.read(samples_per_chunk, exception_on_overflow=False),
+                            dtype=self.dtype
+                        )
+                        
+                        # The blocking mic read takes as long as the chunk, so the matching
+                        # system audio is normally already in the ring
+                        if sys_stream is not None and not self._ring_read(self._sys_chunk, chunk_seconds):
+                            break
+                        
+                        # Downmix the system audio and mix it with the microphone in one compiled
+                        # loop, summing in int32 so the sum can't wrap before it is clipped
+                        mix_i16(mic_data, self._sys_chunk, self._mix_i16)
+                        # The mix buffer is written before it is reused, so no copy is needed
+                        fh.write(self._mix_i16)
+            finally:
+                # Cleanup streams
+                if sys_stream is not None:
+                    sys_stream.stop_stream()
+                    sys_stream.close()
+                mic_stream.stop_stream()
+                mic_stream.close()
             
-            if combined_audio:
-                # Combine all chunks and save
-                full_audio = np.concatenate(combined_audio)
-                wavfile.write(filename, self.rate, full_audio)
-                print(f"Saved combined audio to: {filename}")
+            print(f"Saved combined audio to: {filename}")
                 
         except Exception as e:
             print(f"Error recording combined audio: {e}")
             print(f"Debug info - mic shape: {mic_data.shape if 'mic_data' in locals() else 'N/A'}")
-            print(f"Debug info - sys shape: {sys_data.shape if 'sys_data' in locals() else 'N/A'}")
+            print(f"Debug info - sys frames buffered: {self._ring_head - self._ring_tail}")
 
     def start_recording(self, output_dir=None):
         """Start recording combined audio"""
@@ -204,14 +405,15 @@ class MeetingRecorder:
         # Use default recordings directory if none specified
         output_dir = output_dir or self.recordings_dir
         
-        # Ensure output directory exists
-        os.makedirs(output_dir, exist_ok=True)
+        # The default directory was already created in __init__
+        if output_dir != self.recordings_dir:
+            os.makedirs(output_dir, exist_ok=True)
         
         # Generate filename with timestamp
         combined_filename = self.get_recording_path(prefix="meeting_combined")
         
         print(f"[INFO] Starting recording...")
-        print(f"[DEBUG] Audio will be saved to: {os.path.abspath(combined_filename)}")
+        print(f"[DEBUG] Audio will be saved to: {combined_filename}")
         
         self.recording = True
         
@@ -222,7 +424,8 @@ class MeetingRecorder:
         )
         record_thread.start()
         
-        return [record_thread]
+        self._threads = [record_thread]
+        return self._threads
     
     def stop_recording(self):
         """Stop recording"""
@@ -246,6 +449,12 @@ class MeetingRecorder:
                 thread.join()
             
             print("Recording completed!")
+    
+    def close(self):
+        """Release the PortAudio host once any recording threads have finished"""
+        for thread in self._threads:
+            thread.join()
+        self._pa.terminate()
 
 def main():
     recorder = MeetingRecorder()
@@ -263,8 +472,9 @@ def main():
         print("3. Record for specific duration")
         print("4. List audio devices")
         print("5. Exit")
+        print("6. Refresh audio devices")
         
-        choice = input("\nEnter your choice (1-5): ").strip()
+        choice = input("\nEnter your choice (1-6): ").strip()
         
         if choice == '1':
             try:
@@ -291,9 +501,13 @@ def main():
         elif choice == '5':
             if recorder.recording:
                 recorder.stop_recording()
+            recorder.close()
             print("Goodbye!")
             break
         
+        elif choice == '6':
+            recorder.list_audio_devices(refresh=True)
+        
         else:
             print("Invalid choice. Please try again.")
 